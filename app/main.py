@@ -1,7 +1,39 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from openai import (
+    APIConnectionError,
+    AuthenticationError,
+    InternalServerError,
+    PermissionDeniedError,
+    RateLimitError,
+)
+from qdrant_client.http.exceptions import ResponseHandlingException
 from app.utils import Output, DocumentService, QdrantService
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+
+PDF_PATH = "docs/laws.pdf"
+
+# Failures that repeat on every request until the deployment is fixed:
+# rejected OpenAI credentials and an unreachable Qdrant server.
+CONFIG_ERRORS = (AuthenticationError, PermissionDeniedError, ResponseHandlingException)
+
+# Upstream OpenAI outages (APITimeoutError subclasses APIConnectionError).
+UPSTREAM_ERRORS = (APIConnectionError, InternalServerError)
+
+@app.on_event("startup")
+async def startup():
+    doc_service = DocumentService()
+    qdrant_service = QdrantService(k=2)
+    qdrant_service.connect()
+    
+    documents = await run_in_threadpool(doc_service.create_documents, PDF_PATH)
+    
+    await run_in_threadpool(qdrant_service.load, documents)
+    
+    app.state.documents = documents
+    app.state.qdrant = qdrant_service
 
 @app.get("/")
 async def root():
@@ -9,30 +41,25 @@ async def root():
 
 @app.get("/query")
 async def query_documents(query: str = Query(..., description="Query string to search documents")):
+    if not getattr(app.state, "documents", None):
+        raise HTTPException(status_code=503, detail="No documents found to search through.")
+    
+    qdrant_service = getattr(app.state, "qdrant", None)
+    if qdrant_service is None or qdrant_service.index is None:
+        raise HTTPException(status_code=503, detail="Vector index not initialized.")
+    
     try:
-        doc_service = DocumentService()
-        qdrant_service = QdrantService(k=2)
-        
-        pdf_path = "docs/laws.pdf"
-        documents = doc_service.create_documents(pdf_path)
-        
-        if not documents:
-            return Output(
-                query=query,
-                response="No documents found to search through.",
-                citations=[]
-            )
-        
-        qdrant_service.connect()
-        qdrant_service.load(documents)
-        
-        result = qdrant_service.query(query)
-        
-        return result
+        return await qdrant_service.query(query)
         
+    except CONFIG_ERRORS as e:
+        raise HTTPException(status_code=503, detail=f"Service misconfigured: {type(e).__name__}")
+    except RateLimitError as e:
+        raise HTTPException(status_code=503, detail=f"Upstream rate limited: {type(e).__name__}")
+    except UPSTREAM_ERRORS as e:
+        raise HTTPException(status_code=502, detail=f"Upstream unavailable: {type(e).__name__}")
     except Exception as e:
         return Output(
             query=query,
             response=f"Error processing query: {str(e)}",
             citations=[]
-        )
\ No newline at end of file
+        )
@@ -2,23 +2,36 @@ from pydantic import BaseModel
 from llama_index.core import VectorStoreIndex, Document
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.llms.openai import OpenAI
-from dataclasses import dataclass
+from llama_index.vector_stores.qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from fastapi.concurrency import run_in_threadpool
+from qdrant_client.http import models as rest
 from dotenv import load_dotenv
 import os
-from typing import List, Dict, Any
-import pypdf
+from typing import List, Dict, Any, Iterator
+from functools import lru_cache
+from bisect import bisect_right
+import hashlib
+import io
+import logging
+import orjson
+import pickle
+import fitz
+import numpy as np
 import re
+import time
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 def get_openai_api_key():
     key = os.environ.get("OPENAI_API_KEY")
     if not key:
         raise ValueError("OPENAI_API_KEY environment variable not set")
     return key
 
-@dataclass
-class Citation:
+class Citation(BaseModel):
     source: str
     text: str
 
@@ -27,100 +40,170 @@ class Output(BaseModel):
     response: str
     citations: list[Citation]
 
-def extract_pdf_lines(path: str) -> List[Dict[str, Any]]:
-    reader = pypdf.PdfReader(path)
-    pages = []
-    for i, page in enumerate(reader.pages, start=1):
-        raw = page.extract_text() or ""
-        lines = [l.rstrip() for l in raw.splitlines()]
-        pages.append({"page": i, "lines": lines})
-    return pages
+def extract_pdf_lines(path: str) -> Iterator[Dict[str, Any]]:
+    with fitz.open(path) as doc:
+        for i, page in enumerate(doc, start=1):
+            raw = page.get_text("text") or ""
+            lines = [l.rstrip() for l in raw.splitlines()]
+            yield {"page": i, "lines": lines}
+
+SECTIONS_CACHE_VERSION = 3
+
+def sections_cache_path(pdf_path: str) -> str:
+    root, _ = os.path.splitext(pdf_path)
+    return f"{root}.sections.json"
+
+def load_cached_sections(pdf_path: str):
+    cache_path = sections_cache_path(pdf_path)
+    try:
+        if os.stat(cache_path).st_mtime_ns < os.stat(pdf_path).st_mtime_ns:
+            return None
+        with open(cache_path, "rb") as f:
+            payload = orjson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    
+    if not isinstance(payload, dict) or payload.get("version") != SECTIONS_CACHE_VERSION:
+        return None
+    return payload.get("sections")
+
+def save_cached_sections(pdf_path: str, sections) -> None:
+    try:
+        with open(sections_cache_path(pdf_path), "wb") as f:
+            payload = {"version": SECTIONS_CACHE_VERSION, "sections": sections}
+            f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+    except OSError:
+        pass
+
+def documents_cache_path(pdf_path: str) -> str:
+    root, _ = os.path.splitext(pdf_path)
+    return f"{root}_documents.pkl"
+
+def load_pickled_documents(pdf_path: str):
+    cache_path = documents_cache_path(pdf_path)
+    try:
+        if os.stat(cache_path).st_mtime_ns < os.stat(pdf_path).st_mtime_ns:
+            return None
+        with open(cache_path, "rb") as f:
+            payload = pickle.load(f)
+    except Exception:
+        return None
+    
+    if not isinstance(payload, dict) or payload.get("version") != SECTIONS_CACHE_VERSION:
+        return None
+    return payload.get("documents")
+
+def save_pickled_documents(pdf_path: str, documents: List[Document]) -> None:
+    with open(documents_cache_path(pdf_path), "wb") as f:
+        payload = {"version": SECTIONS_CACHE_VERSION, "documents": documents}
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
 
 def create_documents_from_pdf(pdf_path: str, source_file: str = "docs/laws.pdf"):
-    pages = extract_pdf_lines(pdf_path)
+    documents = load_pickled_documents(pdf_path)
+    if documents is not None:
+        return documents
     
-    all_text = ""
-    for page in pages:
-        all_text += " " + " ".join(page["lines"])
+    sections = load_cached_sections(pdf_path)
+    if sections is None:
+        sections = extract_sections(pdf_path)
+        save_cached_sections(pdf_path, sections)
+    return build_documents(sections, source_file)
+
+SECTION_RE = re.compile(
+    r"^(\d+(?:\.\d+)*)\.?[ \t]*\n(.*?)(?=^\d+(?:\.\d+)*\.?[ \t]*$|^Citations:|\Z)",
+    re.S | re.M
+)
+
+def extract_sections(pdf_path: str) -> List[Dict[str, Any]]:
+    page_offsets = []
+    page_numbers = []
+    buf = io.StringIO()
+    for page in extract_pdf_lines(pdf_path):
+        page_offsets.append(buf.tell())
+        page_numbers.append(page["page"])
+        for line in page["lines"]:
+            buf.write(line)
+            buf.write("\n")
+    all_text = buf.getvalue()
     
-    try:
-        from llama_index.llms.openai import OpenAI
-        from llama_index.core import PromptTemplate
+    sections = []
+    for match in SECTION_RE.finditer(all_text):
+        section_number = match.group(1)
+        lines = [l.strip() for l in match.group(2).splitlines() if l.strip()]
+        if not lines:
+            continue
         
-        api_key = get_openai_api_key()
-        llm = OpenAI(api_key=api_key, model="gpt-4o-mini")
-        
-        extraction_prompt = PromptTemplate(
-            "You are a legal document parser. Extract the legal structure from the following text.\n\n"
-            "CRITICAL INSTRUCTIONS:\n"
-            "- Extract BOTH category headers (like '1', '2', '3') AND substantive laws (like 1.1, 1.1.1, 1.1.2, 2.1, etc.)\n"
-            "- Category headers should have section_number like '1', '2', '3' and represent main topics\n"
-            "- Laws should have section_number like '1.1', '1.1.1', '1.1.2' and represent specific legal provisions\n"
-            "- Each section should be a separate document\n"
-            "- This will allow us to map laws to their categories\n\n"
-            "Text to parse:\n{text}\n\n"
-            "IMPORTANT: Return ONLY valid JSON. Do not include any explanatory text before or after the JSON.\n\n"
-            "Return a JSON array with both categories and laws:\n"
-            "[\n"
-            "  {\n"
-            "    \"section_number\": \"1\",\n"
-            "    \"title\": \"Peace\",\n"
-            "    \"content\": \"Main category for peace-related laws...\"\n"
-            "  },\n"
-            "  {\n"
-            "    \"section_number\": \"1.1\",\n"
-            "    \"title\": \"Dispute Resolution\",\n"
-            "    \"content\": \"The law requires petty lords and landed knights to take their disputes...\"\n"
-            "  }\n"
-            "]"
+        page_start = page_numbers[bisect_right(page_offsets, match.start()) - 1]
+        sections.append({
+            "section_number": section_number,
+            "lines": lines,
+            "content": " ".join(lines),
+            "page_start": page_start
+        })
+    
+    if not sections:
+        raise ValueError(f"No numbered sections found in {pdf_path}")
+    
+    parents = {s["section_number"].rpartition('.')[0] for s in sections}
+    for section in sections:
+        lines = section.pop("lines")
+        section["heading"] = '.' not in section["section_number"] or (
+            len(lines) == 1
+            and section["section_number"] in parents
+            and not lines[0].endswith(('.', '!', '?'))
         )
+        section["title"] = lines[0] if section["heading"] else ""
+    
+    return sections
+
+def build_documents(sections, source_file: str = "docs/laws.pdf") -> List[Document]:
+    documents = []
+    
+    sections = [s for s in sections if isinstance(s, dict) and 'content' in s]
+    sections.sort(key=lambda s: s.get("section_number", "unknown").count('.'))
+    
+    headings = {}
+    for section in sections:
+        section_number = section.get("section_number", "unknown")
         
-        response = llm.complete(extraction_prompt.format(text=all_text[:4000]))
+        if section.get("heading", '.' not in section_number):
+            headings[section_number] = section.get("title", "")
+            continue
         
-        import json
-        try:
-            sections = json.loads(response.text)
-            documents = []
-            
-            categories = {}
-            for section in sections:
-                if isinstance(section, dict) and 'content' in section:
-                    section_number = section.get("section_number", "unknown")
-                    if len(section_number.split('.')) == 1:
-                        categories[section_number] = section.get("title", "")
-            
-            for section in sections:
-                if isinstance(section, dict) and 'content' in section:
-                    section_number = section.get("section_number", "unknown")
-                    content = section["content"]
-                    title = section.get("title", content[:100])
-                    
-                    if len(section_number.split('.')) > 1:
-                        parts = section_number.split('.')
-                        parent_category = parts[0]
-                        category_title = categories.get(parent_category, "")
-                        
-                        law_path = f"{category_title} > {section_number}"
-                        
-                        meta = {
-                            "section_number": section_number,
-                            "title": title,
-                            "category": parent_category,
-                            "category_title": category_title,
-                            "law_path": law_path,
-                            "source_file": source_file,
-                            "citations": [f"{source_file}"]
-                        }
-                        doc = Document(text=content, metadata=meta)
-                        documents.append(doc)
-            
-            return documents
-            
-        except json.JSONDecodeError:
-            raise Exception("LLM extraction failed: Invalid JSON response")
-            
-    except Exception as e:
-        raise Exception(f"LLM extraction failed: {e}")
+        content = section["content"]
+        title = section.get("title", content[:100])
+        parent_category = section_number.partition('.')[0]
+        category_title = headings.get(parent_category, "")
+        
+        prefix = section_number
+        heading_titles = []
+        while '.' in prefix:
+            prefix = prefix.rpartition('.')[0]
+            if prefix in headings:
+                heading_titles.append(headings[prefix])
+        heading_path = " > ".join(reversed(heading_titles))
+        
+        law_path = f"{heading_path} > {section_number}"
+        
+        meta = {
+            "section_number": section_number,
+            "title": title,
+            "category": parent_category,
+            "category_title": category_title,
+            "heading_path": heading_path,
+            "law_path": law_path,
+            "source_file": source_file,
+            "page": section.get("page_start"),
+            "citations": [f"{source_file}"]
+        }
+        doc = Document(text=content, metadata=meta)
+        documents.append(doc)
+    
+    return documents
+
+@lru_cache(maxsize=8)
+def _load_documents(pdf_path: str, mtime_ns: int, size: int) -> List[Document]:
+    return create_documents_from_pdf(pdf_path)
 
 
 class DocumentService:
@@ -129,69 +212,284 @@ class DocumentService:
     
     def create_documents(self, pdf_path: str) -> List[Document]:
         try:
-            return create_documents_from_pdf(pdf_path)
+            stat = os.stat(pdf_path)
+            return list(_load_documents(pdf_path, stat.st_mtime_ns, stat.st_size))
             
         except Exception as e:
             raise Exception(f"Document creation failed: {str(e)}")
 
 
+class SemanticCache:
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600.0, max_size: int = 1024):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clear()
+
+    def clear(self) -> None:
+        self.entries: Dict[bytes, tuple] = {}
+        self.keys: List[bytes] = []
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+
+    def _normalize(self, embedding: List[float]) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        live = [i for i, key in enumerate(self.keys) if now - self.entries[key][0] <= self.ttl]
+        if len(live) == len(self.keys):
+            return
+        for i in set(range(len(self.keys))) - set(live):
+            del self.entries[self.keys[i]]
+        self.keys = [self.keys[i] for i in live]
+        self.matrix = self.matrix[live]
+
+    def get(self, embedding: List[float]):
+        self._evict_expired()
+        if not self.keys:
+            return None
+        
+        scores = self.matrix @ self._normalize(embedding)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return self.entries[self.keys[best]][1]
+
+    def put(self, embedding: List[float], output: "Output") -> None:
+        vec = self._normalize(embedding)
+        key = vec.tobytes()
+        if key not in self.entries:
+            if len(self.keys) >= self.max_size:
+                del self.entries[self.keys.pop(0)]
+                self.matrix = self.matrix[1:]
+            self.keys.append(key)
+            self.matrix = np.vstack([self.matrix, vec]) if self.matrix.size else vec[np.newaxis, :]
+        self.entries[key] = (time.monotonic(), output)
+
+
 class QdrantService:
-    def __init__(self, k: int = 2):
+    def __init__(
+        self,
+        k: int = 2,
+        collection_name: str = "laws",
+        persist_dir: str = "storage",
+        embed_model: str = "text-embedding-3-small",
+        embed_dim: int = 1536,
+        hnsw_m: int = 16,
+        hnsw_ef_construct: int = 128,
+        hnsw_ef: int = 64
+    ):
         self.index = None
+        self.client = None
+        self.aclient = None
+        self.vector_store = None
         self.k = k
+        self.collection_name = collection_name
+        self.persist_dir = persist_dir
+        self.embed_model = embed_model
+        self.embed_dim = embed_dim
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construct = hnsw_ef_construct
+        self.hnsw_ef = hnsw_ef
+        self.cache = SemanticCache()
 
     def connect(self) -> None:
         from llama_index.core import Settings
         
         api_key = get_openai_api_key()
         
-        Settings.embed_model = OpenAIEmbedding(api_key=api_key)
-        Settings.llm = OpenAI(api_key=api_key, model="gpt-5")
+        Settings.embed_model = OpenAIEmbedding(
+            api_key=api_key,
+            model=self.embed_model,
+            embed_batch_size=100
+        )
+        Settings.llm = OpenAI(
+            api_key=api_key,
+            model=os.environ.get("OPENAI_LLM_MODEL", "gpt-4o-mini"),
+            temperature=0
+        )
         
-        self.index = VectorStoreIndex.from_documents([])
+        qdrant_url = os.environ.get("QDRANT_URL")
+        if qdrant_url:
+            qdrant_api_key = os.environ.get("QDRANT_API_KEY")
+            self.client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+            self.aclient = AsyncQdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+        else:
+            logger.warning(
+                "QDRANT_URL not set; using Qdrant local mode with exact search. "
+                "HNSW, quantization and search_params settings have no effect."
+            )
+            # Local mode keeps data per client instance, so an async client
+            # would not see the vectors written through the sync one.
+            storage_path = os.path.join(self.persist_dir, "qdrant")
+            try:
+                self.client = QdrantClient(path=storage_path)
+            except RuntimeError as e:
+                logger.warning(
+                    "Qdrant storage %s is locked by another process (%s); "
+                    "falling back to an in-memory store that will be re-embedded",
+                    storage_path, e
+                )
+                self.client = QdrantClient(":memory:")
 
-    def load(self, docs: List[Document]) -> None:
+    def _fingerprint(self, docs: List[Document]) -> str:
+        digest = hashlib.sha256()
+        digest.update(orjson.dumps({
+            "embed_model": self.embed_model,
+            "embed_dim": self.embed_dim,
+            "distance": "cosine",
+            "hnsw_m": self.hnsw_m,
+            "hnsw_ef_construct": self.hnsw_ef_construct,
+            "quantization": "binary"
+        }, option=orjson.OPT_SORT_KEYS))
         for doc in docs:
-            self.index.insert(doc)
+            digest.update(orjson.dumps(
+                {"text": doc.text, "metadata": doc.metadata},
+                option=orjson.OPT_SORT_KEYS
+            ))
+        return digest.hexdigest()[:16]
+
+    def _ready_alias(self, collection_name: str) -> str:
+        return f"{collection_name}-ready"
+
+    def _is_ready(self, collection_name: str) -> bool:
+        ready_alias = self._ready_alias(collection_name)
+        return any(
+            alias.alias_name == ready_alias and alias.collection_name == collection_name
+            for alias in self.client.get_aliases().aliases
+        )
+
+    def _mark_ready(self, collection_name: str) -> None:
+        self.client.update_collection_aliases(change_aliases_operations=[
+            rest.CreateAliasOperation(create_alias=rest.CreateAlias(
+                collection_name=collection_name,
+                alias_name=self._ready_alias(collection_name)
+            ))
+        ])
+
+    def _drop_stale_collections(self, current: str) -> None:
+        # Only safe in local mode, where this process holds the storage lock;
+        # on a shared server other replicas may still be serving older ones.
+        for collection in self.client.get_collections().collections:
+            stale = collection.name == self.collection_name or (
+                collection.name.startswith(f"{self.collection_name}-") and collection.name != current
+            )
+            if stale:
+                self.client.delete_collection(collection.name)
+
+    def _create_collection(self, collection_name: str) -> None:
+        if self.client.collection_exists(collection_name):
+            self.client.delete_collection(collection_name)
+        
+        self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config=rest.VectorParams(size=self.embed_dim, distance=rest.Distance.COSINE),
+            hnsw_config=rest.HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct),
+            quantization_config=rest.BinaryQuantization(
+                binary=rest.BinaryQuantizationConfig(always_ram=True)
+            )
+        )
+
+    def load(self, docs: List[Document]) -> None:
+        from llama_index.core import Settings, StorageContext
+        
+        if not self.client:
+            raise Exception("Qdrant client not initialized. Call connect() first.")
+        
+        self.cache.clear()
+        collection_name = f"{self.collection_name}-{self._fingerprint(docs)}"
+        
+        if self.client.collection_exists(collection_name) and self._is_ready(collection_name):
+            self.vector_store = QdrantVectorStore(
+                client=self.client,
+                aclient=self.aclient,
+                collection_name=collection_name
+            )
+            self.index = VectorStoreIndex.from_vector_store(
+                self.vector_store,
+                embed_model=Settings.embed_model
+            )
+        else:
+            self._create_collection(collection_name)
+            self.vector_store = QdrantVectorStore(
+                client=self.client,
+                aclient=self.aclient,
+                collection_name=collection_name
+            )
+            self.index = VectorStoreIndex.from_documents(
+                docs,
+                storage_context=StorageContext.from_defaults(vector_store=self.vector_store),
+                embed_model=Settings.embed_model,
+                show_progress=False
+            )
+            self._mark_ready(collection_name)
+        
+        if not self.aclient:
+            self._drop_stale_collections(collection_name)
 
-    def query(self, query_str: str) -> Output:
+    async def query(self, query_str: str) -> Output:
+        from llama_index.core import Settings, QueryBundle
+        
         if not self.index:
-            raise Exception("Vector index not initialized. Call connect() first.")
+            raise Exception("Vector index not initialized. Call connect() and load() first.")
+        
+        embedding = await Settings.embed_model.aget_query_embedding(query_str)
+        cached = self.cache.get(embedding)
+        if cached is not None:
+            return cached.model_copy(update={"query": query_str})
         
         query_engine = self.index.as_query_engine(
             similarity_top_k=self.k,
-            response_mode="compact"
+            response_mode="compact",
+            vector_store_kwargs={
+                "search_params": rest.SearchParams(
+                    hnsw_ef=self.hnsw_ef,
+                    quantization=rest.QuantizationSearchParams(rescore=True, oversampling=2.0)
+                )
+            }
         )
         
-        response = query_engine.query(query_str)
+        query_bundle = QueryBundle(query_str=query_str, embedding=embedding)
+        if self.aclient:
+            response = await query_engine.aquery(query_bundle)
+        else:
+            response = await run_in_threadpool(query_engine.query, query_bundle)
         
         citations = []
         if hasattr(response, 'source_nodes') and response.source_nodes:
             for i, node in enumerate(response.source_nodes[:self.k]):
                 section_number = node.metadata.get('section_number', 'Unknown')
-                category_title = node.metadata.get('category_title', '')
+                heading_path = node.metadata.get('heading_path') or node.metadata.get('category_title', '')
                 title = node.metadata.get('title', '')
                 
-                if category_title and section_number:
-                    source = f"Law {section_number} ({category_title}) - {title}"
+                if heading_path and section_number:
+                    source = f"Law {section_number} ({heading_path})"
                 elif section_number:
-                    source = f"Law {section_number} - {title}"
+                    source = f"Law {section_number}"
                 else:
                     source = f"Chunk {i+1}"
+                if title and section_number:
+                    source = f"{source} - {title}"
                 
-                text = node.text[:200] + "..." if len(node.text) > 200 else node.text
-                citations.append(Citation(source=source, text=text))
+                text = node.text
+                if len(text) > 200:
+                    text = text[:200] + "..."
+                citations.append(Citation.model_construct(source=source, text=text))
         
         if not citations:
-            citations.append(Citation(
+            citations.append(Citation.model_construct(
                 source="Document",
                 text="Information retrieved from document analysis."
             ))
         
-        output = Output(
+        output = Output.model_construct(
             query=query_str,
-            response=response.response,
+            response=response.response or "",
             citations=citations
         )
         
+        self.cache.put(embedding, output)
+        
         return output
\ No newline at end of file
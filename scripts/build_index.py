@@ -0,0 +1,11 @@
+from app.utils import create_documents_from_pdf, save_pickled_documents, documents_cache_path
+
+PDF_PATH = "docs/laws.pdf"
+
+def main():
+    documents = create_documents_from_pdf(PDF_PATH)
+    save_pickled_documents(PDF_PATH, documents)
+    print(f"Wrote {len(documents)} documents to {documents_cache_path(PDF_PATH)}")
+
+if __name__ == "__main__":
+    main()
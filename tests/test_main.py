@@ -0,0 +1,79 @@
+import httpx
+import openai
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils import Citation, Output
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+def _status_error(cls, status_code):
+    return cls("upstream error", response=httpx.Response(status_code, request=REQUEST), body=None)
+
+
+class StubQdrant:
+    def __init__(self, result=None, error=None):
+        self.index = object()
+        self.result = result
+        self.error = error
+
+    async def query(self, query_str):
+        if self.error:
+            raise self.error
+        return self.result
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app.state, "documents", [object()], raising=False)
+    return TestClient(app)
+
+
+def _use(monkeypatch, qdrant):
+    monkeypatch.setattr(app.state, "qdrant", qdrant, raising=False)
+
+
+def test_query_returns_output(client, monkeypatch):
+    output = Output(query="q", response="answer", citations=[Citation(source="Law 1.1", text="t")])
+    _use(monkeypatch, StubQdrant(result=output))
+    
+    response = client.get("/query", params={"query": "q"})
+    
+    assert response.status_code == 200
+    assert response.json()["response"] == "answer"
+
+
+def test_query_failure_returns_output(client, monkeypatch):
+    _use(monkeypatch, StubQdrant(error=ValueError("bad query")))
+    
+    response = client.get("/query", params={"query": "q"})
+    
+    assert response.status_code == 200
+    assert response.json()["citations"] == []
+
+
+@pytest.mark.parametrize("error, status_code", [
+    (_status_error(openai.AuthenticationError, 401), 503),
+    (_status_error(openai.PermissionDeniedError, 403), 503),
+    (_status_error(openai.RateLimitError, 429), 503),
+    (_status_error(openai.InternalServerError, 500), 502),
+    (openai.APIConnectionError(request=REQUEST), 502),
+    (openai.APITimeoutError(request=REQUEST), 502),
+])
+def test_query_upstream_errors_map_to_status(client, monkeypatch, error, status_code):
+    _use(monkeypatch, StubQdrant(error=error))
+    
+    response = client.get("/query", params={"query": "q"})
+    
+    assert response.status_code == status_code
+
+
+def test_query_without_documents_is_unavailable(client, monkeypatch):
+    monkeypatch.setattr(app.state, "documents", [], raising=False)
+    _use(monkeypatch, StubQdrant())
+    
+    response = client.get("/query", params={"query": "q"})
+    
+    assert response.status_code == 503
@@ -0,0 +1,95 @@
+from app import utils
+
+EXPECTED_SECTIONS = [
+    "1", "1.1",
+    "2", "2.1",
+    "3", "3.1", "3.1.1", "3.1.2", "3.1.3",
+    "4", "4.1", "4.1.1", "4.2", "4.2.1", "4.2.2", "4.2.3", "4.2.4",
+    "5", "5.1", "5.1.1", "5.1.2", "5.1.2.1", "5.2",
+    "6", "6.1", "6.2", "6.3",
+    "7", "7.1",
+    "8", "8.1",
+    "9", "9.1", "9.1.1", "9.1.2",
+    "10", "10.1", "10.1.1", "10.1.1.1", "10.1.1.2", "10.1.1.3", "10.1.1.4",
+    "11", "11.1",
+]
+
+
+def test_extract_sections_parses_laws_pdf():
+    sections = utils.extract_sections("docs/laws.pdf")
+    
+    assert [s["section_number"] for s in sections] == EXPECTED_SECTIONS
+    assert sections[0]["title"] == "Peace"
+    assert sections[0]["page_start"] == 1
+    assert sections[-1]["page_start"] == 2
+
+
+def test_extract_sections_excludes_citations_block():
+    sections = utils.extract_sections("docs/laws.pdf")
+    
+    last = sections[-1]["content"]
+    assert last.endswith("he might be whipped instead.")
+    assert all("Citations:" not in s["content"] for s in sections)
+    assert all("https://" not in s["content"] for s in sections)
+
+
+def test_extract_sections_only_titles_headings():
+    sections = {s["section_number"]: s for s in utils.extract_sections("docs/laws.pdf")}
+    
+    assert sections["4"]["heading"] and sections["4"]["title"] == "Trials"
+    assert sections["4.2"]["heading"] and sections["4.2"]["title"] == "Trials by combat"
+    assert not sections["1.1"]["heading"] and sections["1.1"]["title"] == ""
+    assert not sections["2.1"]["heading"]
+    assert not sections["5.1"]["heading"]
+
+
+def test_build_documents_folds_sub_headings_into_law_path():
+    documents = utils.build_documents(utils.extract_sections("docs/laws.pdf"))
+    by_number = {d.metadata["section_number"]: d for d in documents}
+    
+    assert "4.1" not in by_number
+    assert "4.2" not in by_number
+    assert by_number["4.2.1"].metadata["category_title"] == "Trials"
+    assert by_number["4.2.1"].metadata["law_path"] == "Trials > Trials by combat > 4.2.1"
+    assert by_number["1.1"].metadata["law_path"] == "Peace > 1.1"
+
+
+def test_semantic_cache_hit_and_miss():
+    cache = utils.SemanticCache(threshold=0.95)
+    assert cache.get([1.0, 0.0]) is None
+    
+    cache.put([1.0, 0.0], "a")
+    cache.put([0.0, 1.0], "b")
+    
+    assert cache.get([1.0, 0.01]) == "a"
+    assert cache.get([0.01, 1.0]) == "b"
+    assert cache.get([1.0, 1.0]) is None
+
+
+def test_semantic_cache_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(utils.time, "monotonic", lambda: now[0])
+    cache = utils.SemanticCache(ttl=10.0)
+    
+    cache.put([1.0, 0.0], "a")
+    now[0] += 5.0
+    assert cache.get([1.0, 0.0]) == "a"
+    
+    now[0] += 10.0
+    assert cache.get([1.0, 0.0]) is None
+    assert cache.keys == []
+    assert cache.matrix.shape[0] == 0
+
+
+def test_semantic_cache_evicts_oldest_when_full():
+    cache = utils.SemanticCache(max_size=2)
+    
+    cache.put([1.0, 0.0], "a")
+    cache.put([0.0, 1.0], "b")
+    cache.put([1.0, 1.0], "c")
+    
+    assert len(cache.keys) == 2
+    assert cache.matrix.shape[0] == 2
+    assert cache.get([1.0, 0.0]) is None
+    assert cache.get([0.0, 1.0]) == "b"
+    assert cache.get([1.0, 1.0]) == "c"